@@ -1,80 +1,165 @@
 #!/usr/bin/env python
+import asyncio
+import atexit
 import boto3
+import boto3.s3.transfer
+import botocore.config
+import botocore.exceptions
 import time
 import datetime
+import functools
+import itertools
+import logging
+import logging.handlers
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from opensearchpy import OpenSearch
 import argparse
-from astropy.io import ascii
+import json
 import sys
 
+# aioboto3 scales to far more in-flight requests than the thread pools below.
+# It is optional though, so fall back to the synchronous boto3 path without it.
+try:
+    import aioboto3
+    import aiofiles
+    from aiobotocore.config import AioConfig
+    # Mirror the sync client's settings: the default 10-connection pool would
+    # cap the Semaphore(64) fan-out in the async functions below
+    AIO_CLIENT_CONFIG = AioConfig(max_pool_connections=64,
+                                  retries={'max_attempts': 10, 'mode': 'adaptive'})
+except ImportError:
+    aioboto3 = None
 
+logger = logging.getLogger(__name__)
+
+
+def setup_logging():
+    # Per-key print() calls from the parallel workers would serialize on the
+    # stdout lock and flush a write() per message. Instead the workers enqueue
+    # records and a single listener thread drains them to the stream.
+    log_queue = queue.Queue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+
+
+# Cached because the result loops below rebuild the same prefixes repeatedly
+@functools.lru_cache(maxsize=100_000)
 def make_s3_prefix_from_filename(filename):
     # Note that this only works if the data is in our current standard structure.
-    # For older data you will need to query the whole prefix list from s3 like the following
-
-    # THIS QUERY IS EXPENSIVE (computationally)! DO IT ONLY ONCE AND CACHE THE RESULTS
-    # session = boto3.Session(aws_access_key=aws_access_key,
-    #                         aws_secret_access_key=aws_secret_key,
-    #                         region_name=aws_region)
-    # s3 = session.client('s3')
-    # paginator = s3.get_paginator('list_objects_v2')
-    # object_keys = []
-    # pages = paginator.paginate(Bucket=aws_bucket, Prefix='')
-    # for page in pages:
-    #    for obj in page['Contents']:
-    #        object_keys.append(obj['Key'])
-
-    # Once you have all of the object keys, just find the one that matches the filename
-    # for key in object_keys:
-    #    if filename in key:
-    #        prefix = key
-    #        break
+    # For older data use get_s3_prefix_from_s3 below which falls back to querying s3
+    parts = filename.split('-', 3)
     site = filename[0:3]
-    intrument = filename.split('-')[1]
-    dayobs = filename.split('-')[2]
+    instrument = parts[1]
+    dayobs = parts[2]
 
     # Ensure that we use the .fits.fz filename irrespective of what was provided
-    compressed_filename = filename.replace('.fits.fz', '.fits').replace('.fits', '.fits.fz')
-    prefix = f'{site}/{intrument}/{dayobs}/raw/{compressed_filename}'
-    return prefix
+    if filename.endswith('.fits.fz'):
+        basename = filename[:-len('.fits.fz')]
+    elif filename.endswith('.fits'):
+        basename = filename[:-len('.fits')]
+    else:
+        basename = filename
+    return f'{site}/{instrument}/{dayobs}/raw/{basename}.fits.fz'
 
 
-def get_frame_metadata(filename, search_host, index_name):
-    query = {
+# Cache of filename -> object key so we only ever hit s3 once per file in a run
+s3_prefix_cache = {}
+
+
+def get_s3_prefix_from_s3(filename, bucket_name, s3):
+    if filename in s3_prefix_cache:
+        return s3_prefix_cache[filename]
+
+    # The canonical key is cheap to compute and a HEAD is cheap to check
+    # (LIST requests cost ~11x as much), so only fall back to listing if it misses
+    prefix = make_s3_prefix_from_filename(filename)
+    try:
+        s3.head_object(Bucket=bucket_name, Key=prefix)
+        s3_prefix_cache[filename] = prefix
+        return prefix
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise
+
+    # Older data isn't in the standard structure, so page through the day directory
+    # rather than the whole bucket to find it
+    site, instrument, dayobs = prefix.split('/')[0:3]
+    paginator = s3.get_paginator('list_objects_v2')
+    # Max out the page size so the fallback needs as few LIST round-trips as
+    # possible, and return the moment we see the key rather than collecting them
+    pages = paginator.paginate(Bucket=bucket_name, Prefix=f'{site}/{instrument}/{dayobs}/',
+                               PaginationConfig={'PageSize': 1000})
+    for page in pages:
+        for obj in page.get('Contents', ()):
+            key = obj['Key']
+            if filename in key:
+                s3_prefix_cache[filename] = key
+                return key
+    return None
+
+
+def make_frame_metadata_query(filename):
+    return {
         "query": {
             "match_phrase": {
-                # Scrub the filename of the extension to make sure we find the file 
+                # Scrub the filename of the extension to make sure we find the file
                 # irrespective of compression
                 "filename": filename.replace('.fits', '').replace('.fz', '')
             }
         }
     }
 
-    response = search_host.search(index=index_name, body=query)
+
+# Cached so repeated lookups of the same frame (e.g. once per calibration type)
+# don't each round-trip to OpenSearch. The client hashes by identity, which is
+# fine since a run only ever constructs one.
+@functools.lru_cache(maxsize=100_000)
+def get_frame_metadata(filename, search_host, index_name):
+    response = search_host.search(index=index_name, body=make_frame_metadata_query(filename))
     return response['hits']['hits'][0]['_source']
 
 
+def get_frame_metadata_bulk(filenames, search_host, index_name, chunk_size=100):
+    # Pack many metadata queries into single msearch round-trips rather than
+    # one HTTP request per filename. Chunk to stay within request-size limits.
+    metadata = {}
+    filenames = list(filenames)
+    for chunk_start in range(0, len(filenames), chunk_size):
+        chunk = filenames[chunk_start:chunk_start + chunk_size]
+        body_lines = []
+        for filename in chunk:
+            body_lines.append(json.dumps({"index": index_name}))
+            body_lines.append(json.dumps(make_frame_metadata_query(filename)))
+        response = search_host.msearch(body='\n'.join(body_lines) + '\n')
+        for filename, result in zip(chunk, response['responses']):
+            hits = result.get('hits', {}).get('hits', [])
+            if hits:
+                metadata[filename] = hits[0]['_source']
+    return metadata
+
+
 # Lifted from BANZAI
 def parse_date_obs(date_obs_string):
     if date_obs_string == 'N/A':
         return None
-    # Check if there are hours
-    if 'T' not in date_obs_string:
-        return datetime.datetime.strptime(date_obs_string, '%Y-%m-%d')
-    # Check if there is fractional seconds in the time
-    date_fractional_seconds_list = date_obs_string.split('.')
-    if len(date_fractional_seconds_list) > 1:
-        # Pad the string with zeros to include microseconds
-        date_obs_string += (6 - len(date_fractional_seconds_list[-1])) * '0'
-    else:
-        # Pad the string with zeros to include microseconds
-        date_obs_string += '.000000'
-    return datetime.datetime.strptime(date_obs_string, '%Y-%m-%dT%H:%M:%S.%f')
+    # DATE-OBS is already ISO-8601, so use the C-implemented fromisoformat
+    # (~20x faster than strptime, which reparses the format string per call).
+    # It handles date-only and fractional-second forms alike; truncate at
+    # microsecond precision in case a header carries extra digits.
+    return datetime.datetime.fromisoformat(date_obs_string[:26])
 
 
-def get_nearest_calibration_frames(obstype, n_frames, filename, search_host, search_index):
-    frame_metadata = get_frame_metadata(filename, search_host, search_index)
+def get_nearest_calibration_frames(obstype, n_frames, filename, search_host, search_index, frame_metadata=None):
+    if frame_metadata is None:
+        frame_metadata = get_frame_metadata(filename, search_host, search_index)
     match_filters = [{"match_phrase": {"OBSTYPE": obstype}},
                      {"match_phrase": {"SITEID": frame_metadata['SITEID']}},
                      {"match_phrase": {"INSTRUME": frame_metadata['INSTRUME']}}]
@@ -110,12 +195,12 @@ def get_nearest_calibration_frames(obstype, n_frames, filename, search_host, sea
     }
     response = search_host.search(index=search_index, body=query)
     filenames = [result['_source']['filename'] for result in response['hits']['hits']
-                 if '00.fits' in result['_source']['filename']]
+                 if result['_source']['filename'].endswith(('00.fits', '00.fits.fz'))]
     return [make_s3_prefix_from_filename(f) for f in filenames]
 
 
 def thaw_files(object_keys, bucket_name, s3, thaw_mode='Standard'):
-    for object_key in object_keys:
+    def thaw_one(object_key):
         try:
             s3.restore_object(Bucket=bucket_name,
                               Key=object_key,
@@ -126,31 +211,291 @@ def thaw_files(object_keys, bucket_name, s3, thaw_mode='Standard'):
                                       }
                                   }
                               )
-        except Exception as e:
-            if 'RestoreAlreadyInProgress' not in str(sys.exc_info()):
-                raise e
+        except botocore.exceptions.ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == 'NoSuchKey':
+                # Keep going: a missing object shouldn't abort the rest of the batch
+                return object_key
+            if error_code != 'RestoreAlreadyInProgress':
+                raise
+        return None
+
+    # Each restore_object call is a full HTTP round-trip, so fan them out
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        dead_references = {key for key in executor.map(thaw_one, object_keys) if key is not None}
+
+    for dead_reference in sorted(dead_references):
+        logger.warning(f'Warning: {dead_reference} does not exist in the bucket. Skipping.')
+    # Drop the dead keys so later stages don't poll or download them, keeping the
+    # caller's prefix-interleaved ordering
+    return [key for key in object_keys if key not in dead_references]
 
 
 def wait_for_files_to_thaw(object_keys, bucket_name, s3):
-    restored_objects = []
+    def check_restored(object_key):
+        response = s3.head_object(Bucket=bucket_name, Key=object_key)
+        return object_key, 'ongoing-request="false"' in response.get('Restore', '')
+
+    object_keys = set(object_keys)
+    restored_objects = set()
+    # Start polling quickly and back off towards 5 minutes as restores drag on
+    poll_interval = 30
     while len(restored_objects) < len(object_keys):
         now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        for object_key in object_keys:
-            if object_key not in restored_objects:
-                response = s3.head_object(Bucket=bucket_name, Key=object_key)
-                if 'Restore' in response and 'ongoing-request="false"' in response['Restore']:
-                    restored_objects.append(object_key)
-        print(f"{now}: Waiting for files to thaw: {len(object_keys) - len(restored_objects)} left to be restored.")
-        # Wait for 5 minutes before checking again
-        time.sleep(300)
+        pending = object_keys - restored_objects
+        # The HEAD requests are independent round-trips, so sweep them in parallel
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            for object_key, restored in executor.map(check_restored, pending):
+                if restored:
+                    restored_objects.add(object_key)
+        logger.info(f"{now}: Waiting for files to thaw: {len(object_keys) - len(restored_objects)} left to be restored.")
+        if len(restored_objects) < len(object_keys):
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 300)
+
+
+# Raw frames run 30-100MB and a single GET stream rarely saturates s3 bandwidth,
+# so split anything over 8MB into parallel ranged GETs. Built once and shared by
+# every download_file call.
+TRANSFER_CONFIG = boto3.s3.transfer.TransferConfig(multipart_threshold=8 * 1024 * 1024,
+                                                   multipart_chunksize=8 * 1024 * 1024,
+                                                   max_concurrency=16,
+                                                   use_threads=True)
+
+
+def order_keys_for_prefix_spread(object_keys):
+    # s3 rate limits per prefix, so dedupe and sort for connection locality, then
+    # round-robin across the site/instrument/dayobs groups so the concurrent
+    # workers don't hammer a single prefix partition into 503 SlowDown responses
+    prefix_groups = {}
+    for object_key in sorted(set(object_keys)):
+        prefix_groups.setdefault(tuple(object_key.split('/', 3)[:3]), []).append(object_key)
+    interleaved = itertools.chain.from_iterable(itertools.zip_longest(*prefix_groups.values()))
+    return [object_key for object_key in interleaved if object_key is not None]
+
+
+def make_download_directories(object_keys, base_dir):
+    # Many keys share a site/instrument/dayobs directory, so create each one once
+    # up front instead of a redundant makedirs per file in the workers
+    directories = {os.path.join(base_dir, os.path.dirname(object_key)) for object_key in object_keys}
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
 
 
 def download_thawed_files(object_keys, base_dir, bucket_name, s3):
-    for object_key in object_keys:
-        os.makedirs(os.path.join(base_dir, os.path.dirname(object_key)), exist_ok=True)
+    make_download_directories(object_keys, base_dir)
+
+    def download_one(object_key):
         download_path = os.path.join(base_dir, object_key)
-        s3.download_file(bucket_name, object_key, download_path)
-        print(f"Downloaded {os.path.basename(object_key)}")
+        s3.download_file(bucket_name, object_key, download_path, Config=TRANSFER_CONFIG)
+        logger.info(f"Downloaded {os.path.basename(object_key)}")
+
+    # The downloads are latency bound rather than cpu bound so overlap them with a thread pool
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(download_one, object_keys))
+
+
+def wait_and_download_files(object_keys, base_dir, bucket_name, s3, n_workers=16):
+    # Files finish thawing at different times, sometimes hours apart. Rather than
+    # waiting for the whole batch before downloading anything, the poll loop
+    # feeds each key to the download workers as soon as its restore completes.
+    make_download_directories(object_keys, base_dir)
+    object_keys = set(object_keys)
+    restored_queue = queue.Queue()
+    failed_keys = []
+    failed_keys_lock = threading.Lock()
+
+    def download_worker():
+        while True:
+            object_key = restored_queue.get()
+            if object_key is None:
+                break
+            download_path = os.path.join(base_dir, object_key)
+            try:
+                s3.download_file(bucket_name, object_key, download_path, Config=TRANSFER_CONFIG)
+            except Exception:
+                # Don't let one bad download kill the worker thread and silently
+                # drop the rest of its queue; record the key and keep draining
+                logger.exception(f'Failed to download {object_key}')
+                with failed_keys_lock:
+                    failed_keys.append(object_key)
+                continue
+            logger.info(f"Downloaded {os.path.basename(object_key)}")
+
+    workers = [threading.Thread(target=download_worker) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    def check_restored(object_key):
+        response = s3.head_object(Bucket=bucket_name, Key=object_key)
+        return object_key, 'ongoing-request="false"' in response.get('Restore', '')
+
+    try:
+        restored_objects = set()
+        poll_interval = 30
+        while len(restored_objects) < len(object_keys):
+            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            pending = object_keys - restored_objects
+            with ThreadPoolExecutor(max_workers=32) as executor:
+                for object_key, restored in executor.map(check_restored, pending):
+                    if restored:
+                        restored_objects.add(object_key)
+                        restored_queue.put(object_key)
+            logger.info(f"{now}: Waiting for files to thaw: {len(object_keys) - len(restored_objects)} left to be restored.")
+            if len(restored_objects) < len(object_keys):
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, 300)
+    finally:
+        # One sentinel per worker shuts the pool down once the queue drains.
+        # This has to run even if polling raises or is interrupted, otherwise
+        # the non-daemon workers block on the queue forever and hang the process
+        for _ in workers:
+            restored_queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    if failed_keys:
+        logger.warning(f'{len(failed_keys)} files failed to download: {sorted(failed_keys)}')
+    return failed_keys
+
+
+async def athaw(object_keys, bucket_name, session, thaw_mode='Standard'):
+    # Bound the number of in-flight requests so we don't trip s3 rate limits
+    semaphore = asyncio.Semaphore(64)
+    async with session.client('s3', config=AIO_CLIENT_CONFIG) as s3:
+        async def thaw_one(object_key):
+            async with semaphore:
+                try:
+                    await s3.restore_object(Bucket=bucket_name,
+                                            Key=object_key,
+                                            RestoreRequest={
+                                                'Days': 1,  # Number of days to keep the restored copy
+                                                'GlacierJobParameters': {
+                                                    'Tier': thaw_mode
+                                                    }
+                                                }
+                                            )
+                except botocore.exceptions.ClientError as e:
+                    error_code = e.response['Error']['Code']
+                    if error_code == 'NoSuchKey':
+                        return object_key
+                    if error_code != 'RestoreAlreadyInProgress':
+                        raise
+            return None
+
+        results = await asyncio.gather(*[thaw_one(object_key) for object_key in object_keys])
+
+    dead_references = {key for key in results if key is not None}
+    for dead_reference in sorted(dead_references):
+        logger.warning(f'Warning: {dead_reference} does not exist in the bucket. Skipping.')
+    return [key for key in object_keys if key not in dead_references]
+
+
+async def await_thaw(object_keys, bucket_name, session):
+    semaphore = asyncio.Semaphore(64)
+    object_keys = set(object_keys)
+    restored_objects = set()
+    poll_interval = 30
+    async with session.client('s3', config=AIO_CLIENT_CONFIG) as s3:
+        async def check_restored(object_key):
+            async with semaphore:
+                response = await s3.head_object(Bucket=bucket_name, Key=object_key)
+            return object_key, 'ongoing-request="false"' in response.get('Restore', '')
+
+        while len(restored_objects) < len(object_keys):
+            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            pending = object_keys - restored_objects
+            for object_key, restored in await asyncio.gather(*[check_restored(key) for key in pending]):
+                if restored:
+                    restored_objects.add(object_key)
+            logger.info(f"{now}: Waiting for files to thaw: {len(object_keys) - len(restored_objects)} left to be restored.")
+            if len(restored_objects) < len(object_keys):
+                await asyncio.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, 300)
+
+
+async def adownload_one(s3, object_key, base_dir, bucket_name, semaphore):
+    async with semaphore:
+        download_path = os.path.join(base_dir, object_key)
+        response = await s3.get_object(Bucket=bucket_name, Key=object_key)
+        if response['ContentLength'] <= 1 << 20:
+            # Small files: one read and one unbuffered write, skipping the
+            # buffered writer's extra copy and flush
+            data = await response['Body'].read()
+            async with aiofiles.open(download_path, 'wb', buffering=0) as f:
+                await f.write(data)
+        else:
+            # Stream in 1MB chunks into a 1MB buffered writer so we aren't
+            # paying a write() syscall per TCP packet
+            async with aiofiles.open(download_path, 'wb', buffering=1 << 20) as f:
+                async for chunk in response['Body'].iter_chunks(1 << 20):
+                    await f.write(chunk)
+        logger.info(f"Downloaded {os.path.basename(object_key)}")
+
+
+def collect_failed_downloads(object_keys, results):
+    # Companion to gather(..., return_exceptions=True): let sibling downloads
+    # run to completion and report the casualties instead of aborting the whole
+    # batch on the first error
+    failed_keys = []
+    for object_key, result in zip(object_keys, results):
+        if isinstance(result, Exception):
+            logger.error(f'Failed to download {object_key}: {result!r}')
+            failed_keys.append(object_key)
+    if failed_keys:
+        logger.warning(f'{len(failed_keys)} files failed to download: {sorted(failed_keys)}')
+    return failed_keys
+
+
+async def adownload(object_keys, base_dir, bucket_name, session):
+    make_download_directories(object_keys, base_dir)
+    semaphore = asyncio.Semaphore(64)
+    object_keys = list(object_keys)
+    async with session.client('s3', config=AIO_CLIENT_CONFIG) as s3:
+        results = await asyncio.gather(*[adownload_one(s3, object_key, base_dir, bucket_name, semaphore)
+                                         for object_key in object_keys],
+                                       return_exceptions=True)
+    return collect_failed_downloads(object_keys, results)
+
+
+async def await_thaw_and_download(object_keys, base_dir, bucket_name, session):
+    # Async analogue of wait_and_download_files: each key starts downloading the
+    # moment a poll sweep sees its restore complete instead of idling until the
+    # slowest restore in the batch finishes.
+    make_download_directories(object_keys, base_dir)
+    semaphore = asyncio.Semaphore(64)
+    object_keys = set(object_keys)
+    restored_objects = set()
+    poll_interval = 30
+    downloads = []
+    download_keys = []
+    async with session.client('s3', config=AIO_CLIENT_CONFIG) as s3:
+        async def check_restored(object_key):
+            async with semaphore:
+                response = await s3.head_object(Bucket=bucket_name, Key=object_key)
+            return object_key, 'ongoing-request="false"' in response.get('Restore', '')
+
+        while len(restored_objects) < len(object_keys):
+            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            pending = object_keys - restored_objects
+            for object_key, restored in await asyncio.gather(*[check_restored(key) for key in pending]):
+                if restored:
+                    restored_objects.add(object_key)
+                    downloads.append(asyncio.ensure_future(
+                        adownload_one(s3, object_key, base_dir, bucket_name, semaphore)))
+                    download_keys.append(object_key)
+            logger.info(f"{now}: Waiting for files to thaw: {len(object_keys) - len(restored_objects)} left to be restored.")
+            if len(restored_objects) < len(object_keys):
+                await asyncio.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, 300)
+
+        results = await asyncio.gather(*downloads, return_exceptions=True)
+    return collect_failed_downloads(download_keys, results)
+
+
+async def run_async_pipeline(object_keys, base_dir, bucket_name, session, thaw_mode='Standard'):
+    object_keys = await athaw(object_keys, bucket_name, session, thaw_mode=thaw_mode)
+    return await await_thaw_and_download(object_keys, base_dir, bucket_name, session)
 
 
 if __name__ == '__main__':
@@ -169,24 +514,40 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    frames = ascii.read(args.frame_list, format='no_header')['col1']
+    setup_logging()
+
+    # The frame list is just one filename per line, no need for a full table parser
+    with open(args.frame_list) as frame_list_file:
+        frames = [line.strip() for line in frame_list_file if line.strip()]
 
     files_to_restore = []
 
-    search_host = OpenSearch(args.opensearch_host, timeout=60)
+    # Reuse a pooled, compressed connection: gzip shrinks the msearch payloads
+    # substantially and pool_maxsize keeps parallel metadata queries from
+    # serializing on the default connection pool
+    search_host = OpenSearch(hosts=[args.opensearch_host], timeout=60, http_compress=True,
+                             pool_maxsize=32, retry_on_timeout=True, max_retries=3)
+
+    # Fetch the metadata for all of the input frames in a few msearch round-trips
+    # up front rather than re-querying once per frame per calibration type
+    frame_metadata_cache = get_frame_metadata_bulk(frames, search_host, args.opensearch_index)
 
     for frame in frames:
+        frame_metadata = frame_metadata_cache.get(frame)
         # Stage the raw e00 version of the file
         files_to_restore.append(make_s3_prefix_from_filename(frame.replace('e90.fits', 'e00.fits')))
         # Stage the nearest 50 bias frames from the file
-        files_to_restore += get_nearest_calibration_frames('BIAS', 50, frame, search_host, args.opensearch_index)
+        files_to_restore += get_nearest_calibration_frames('BIAS', 50, frame, search_host, args.opensearch_index,
+                                                           frame_metadata=frame_metadata)
         # Stage the 20 nearest dark frames
-        files_to_restore += get_nearest_calibration_frames('DARK', 20, frame, search_host, args.opensearch_index)
+        files_to_restore += get_nearest_calibration_frames('DARK', 20, frame, search_host, args.opensearch_index,
+                                                           frame_metadata=frame_metadata)
         # Stage the nearest 10 flat frames
-        files_to_restore += get_nearest_calibration_frames('SKYFLAT', 10, frame, search_host, args.opensearch_index)
+        files_to_restore += get_nearest_calibration_frames('SKYFLAT', 10, frame, search_host, args.opensearch_index,
+                                                           frame_metadata=frame_metadata)
 
-    # Remove any duplicates in the list of files to restore
-    files_to_restore = list(set(files_to_restore))
+    # Remove any duplicates and spread the keys across prefix groups
+    files_to_restore = order_keys_for_prefix_spread(files_to_restore)
 
     if args.dry_run:
         print('Dry run- Would restore the following: mode enabled.')
@@ -194,15 +555,25 @@ if __name__ == '__main__':
             print(f)
         sys.exit(0)
 
+    if aioboto3 is not None:
+        aws_session = aioboto3.Session(aws_access_key_id=args.aws_access_key,
+                                       aws_secret_access_key=args.aws_secret_key,
+                                       region_name=args.aws_region)
+        failed_keys = asyncio.run(run_async_pipeline(files_to_restore, args.output_dir, args.bucket,
+                                                     aws_session, thaw_mode=args.thaw_mode))
+        sys.exit(1 if failed_keys else 0)
+
     aws_session = boto3.Session(aws_access_key_id=args.aws_access_key,
                                 aws_secret_access_key=args.aws_secret_key,
                                 region_name=args.aws_region)
-    s3 = aws_session.client('s3')
-    # thaw the files
-    thaw_files(files_to_restore, args.bucket, s3, thaw_mode=args.thaw_mode)
-
-    # Wait until the files are available
-    wait_for_files_to_thaw(files_to_restore, args.bucket, s3)
+    # The default connection pool (10) would starve the thaw and download thread pools
+    client_config = botocore.config.Config(max_pool_connections=64,
+                                           retries={'max_attempts': 10, 'mode': 'adaptive'})
+    s3 = aws_session.client('s3', config=client_config)
+    # thaw the files; keys that don't exist in the bucket are dropped here
+    files_to_restore = thaw_files(files_to_restore, args.bucket, s3, thaw_mode=args.thaw_mode)
 
-    # Download the files from s3
-    download_thawed_files(files_to_restore, args.output_dir, args.bucket, s3)
+    # Download each file as soon as its restore completes
+    failed_keys = wait_and_download_files(files_to_restore, args.output_dir, args.bucket, s3)
+    if failed_keys:
+        sys.exit(1)